@@ -30,6 +30,48 @@ func (s *SmartContracts) UpdateStatus(ctx contractapi.TransactionContextInterfac
 	return ctx.GetStub().PutState(id, slotJSON)
 }
 
+type SlotUpdate struct {
+	ID       string `json:"id"`
+	Occupied bool   `json:"occupied"`
+	Location string `json:"location"`
+}
+
+func (s *SmartContract) UpdateStatusBatch(ctx contractapi.TransactionContextInterface, updatesJSON string) error {
+	var updates []SlotUpdate
+	if err := json.Unmarshal([]byte(updatesJSON), &updates); err != nil {
+		return fmt.Errorf("invalid batch payload: %v", err)
+	}
+
+	// Use the proposal timestamp so every endorsing peer writes the same value
+	txTimestamp, err := ctx.GetStub().GetTxTimestamp()
+	if err != nil {
+		return fmt.Errorf("failed to read transaction timestamp: %v", err)
+	}
+	timestamp := time.Unix(txTimestamp.Seconds, int64(txTimestamp.Nanos)).UTC().Format(time.RFC3339)
+	updated := make([]string, 0, len(updates))
+	for i, update := range updates {
+		// Updates arrive grouped by location and slot; only the last write per slot is kept
+		if i+1 < len(updates) && updates[i+1].ID == update.ID {
+			continue
+		}
+		slot := ParkingSlot{
+			ID:        update.ID,
+			Location:  update.Location,
+			Occupied:  update.Occupied,
+			Timestamp: timestamp,
+		}
+		slotJSON, _ := json.Marshal(slot)
+		if err := ctx.GetStub().PutState(update.ID, slotJSON); err != nil {
+			return err
+		}
+		updated = append(updated, update.ID)
+	}
+
+	// One event for the whole batch instead of one per slot
+	eventJSON, _ := json.Marshal(updated)
+	return ctx.GetStub().SetEvent("SlotStatusBatch", eventJSON)
+}
+
 func (s *SmartContract) GetAllSlots(ctx contractapi.TransactionContextInterface) ([]ParkingSlot, error) {
 	resultsIterator, _ := ctx.GetStub().GetStateByRange("", "")
 	defer resultsIterator.Close()
@@ -3,22 +3,67 @@
 """
 Flask API Server for IoT Smart Parking System
 Serves real data from unified_iot_blockchain.py to the web dashboard
+
+Production: serve with a threaded WSGI server through the app factory, e.g.
+
+    gunicorn -w 1 -k gthread --threads 16 \
+        'flask_api_server_to_getvalue_from_python_code:create_app()'
+
+Use a single worker: data_server is process-global, and the collector thread
+must run inside the worker that serves requests, so do not use --preload
+(threads started in the master are not inherited by forked workers).
+Each open /api/stream (Server-Sent Events) client holds one server thread,
+so size --threads for the expected number of dashboards.
+Set IOT_AUTOSTART=0 to create the app without starting data collection.
 """
 
-from flask import Flask, jsonify, render_template_string
+from flask import Flask, Response, request
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+import orjson
+import gzip
 import threading
 import time
 import json
 import os
 from datetime import datetime, timedelta
 import logging
-from dataclasses import asdict
+from collections import deque
 
 # Import your existing IoT classes
 from unified_iot_blockchain import IoTNetworkManager, BlockchainConnector
 
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+CYCLE_INTERVAL = 10  # seconds between collector cycles
+ERROR_BACKOFF = 5  # seconds to wait after a failed cycle
+STREAM_KEEPALIVE = 15  # seconds between SSE keep-alive comments
+COMPRESS_MIN_SIZE = 512  # bytes; smaller payloads are served uncompressed
+COMPRESS_LEVEL = 6
+
+# Static envelope shared by every cached API response
+_SUCCESS_PREFIX = b'{"status":"success","data":'
+
+# Sections updated per node only when that node's state changes
+DELTA_SECTIONS = ('parking_slots', 'battery_status')
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def ojsonify(payload):
+    """Serialize payload with orjson into a JSON response"""
+    return Response(orjson.dumps(payload, option=ORJSON_OPTIONS), mimetype='application/json')
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)  # Enable CORS for web dashboard
 
 # Configure logging
@@ -28,6 +73,7 @@ logger = logging.getLogger(__name__)
 class IoTDataServer:
     def __init__(self):
         self.network_manager = None
+        self._slot_ids = ()
         self.current_data = {
             'system_overview': {
                 'total_slots': 0,
@@ -42,10 +88,10 @@ class IoTDataServer:
                 'temperature': 25,
                 'humidity': 50,
                 'pressure': 1013.25,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': datetime.now()
             },
             'battery_status': {},
-            'recent_activity': [],
+            'recent_activity': deque(maxlen=20),
             'blockchain_stats': {
                 'total_transactions': 0,
                 'successful_updates': 0,
@@ -54,6 +100,19 @@ class IoTDataServer:
             }
         }
         self.is_running = False
+        self._stop_evt = threading.Event()
+        self._refresh_evt = threading.Event()
+        self._last_attempt = time.monotonic()
+        self._last_node_state = {}
+        self._dirty_slots = set()
+        self._last_battery_state = {}
+        self._dirty_batteries = set()
+        self.cycle_seq = 0
+        self._boot_id = int(time.time())
+        self.cached = (None, {}, {})
+        self.cached_inner = {}
+        self._cycle_cond = threading.Condition()
+        self._publish_cache()
         
     def initialize_network(self, num_nodes=12):
 
@@ -61,6 +120,8 @@ class IoTDataServer:
             self.network_manager = IoTNetworkManager()
             success = self.network_manager.initialize_network(num_nodes)
             if success:
+                # Node list is fixed after initialization, so format slot ids once
+                self._slot_ids = tuple(f"slot-{i}" for i in range(1, len(self.network_manager.nodes) + 1))
                 logger.info(f" IoT network initialized with {num_nodes} nodes")
                 return True
             else:
@@ -77,6 +138,7 @@ class IoTDataServer:
             return False
             
         self.is_running = True
+        self._stop_evt.clear()
         
 
         collection_thread = threading.Thread(target=self._collect_data_loop, daemon=True)
@@ -85,45 +147,80 @@ class IoTDataServer:
         logger.info("Started real-time data collection")
         return True
     
+    def stop_data_collection(self):
+
+        self.is_running = False
+        self._stop_evt.set()
+        self._refresh_evt.set()  # Wake the collector immediately
+    
+    def request_refresh(self):
+        """Wake the collector early when the last collection attempt is older than a cycle"""
+        # Measured from the last attempt, not the last success, so polling during
+        # an outage does not cut the error backoff short
+        if time.monotonic() - self._last_attempt > CYCLE_INTERVAL:
+            self._refresh_evt.set()
+    
     def _collect_data_loop(self):
 
         while self.is_running:
+            self._last_attempt = time.monotonic()
             try:
                 # Run network cycle and collect data
                 cycle_stats = self.network_manager.run_network_cycle()
                 
+                # Build the next snapshot without touching the published one
+                snapshot = dict(self.current_data)
+                
+                # Query each node's battery once and share it between sections
+                statuses = [(node, node.power.get_battery_status())
+                            for node in self.network_manager.nodes]
+                
                 # Update system overview
-                self._update_system_overview(cycle_stats)
+                self._update_system_overview(snapshot, cycle_stats)
                 
                 # Update parking slots data
-                self._update_parking_slots()
+                self._update_parking_slots(snapshot, statuses)
                 
                 # Update environmental data
-                self._update_environmental_data()
+                self._update_environmental_data(snapshot)
                 
                 # Update battery status
-                self._update_battery_status()
+                self._update_battery_status(snapshot, statuses)
                 
                 # Update blockchain stats
-                self._update_blockchain_stats()
+                self._update_blockchain_stats(snapshot)
                 
                 # Add recent activity
-                self._add_recent_activity(cycle_stats)
+                self._add_recent_activity(snapshot, cycle_stats)
+                
+                # Publish with a single reference swap
+                self.current_data = snapshot
                 
-                # Sleep for next cycle
-                time.sleep(10)  # 10 seconds per cycle
+                # Serialize responses once per cycle
+                self.cycle_seq += 1
+                self._publish_cache()
+                delay = CYCLE_INTERVAL
                 
             except Exception as e:
                 logger.error(f" Data collection error: {str(e)}")
-                time.sleep(5)
+                # The snapshot was discarded, so rebuild every slot next cycle
+                self._last_node_state.clear()
+                self._last_battery_state.clear()
+                delay = ERROR_BACKOFF
+            
+            # Sleep until the next cycle, an on-demand refresh or shutdown
+            self._refresh_evt.wait(delay)
+            self._refresh_evt.clear()
+            if self._stop_evt.is_set():
+                break
     
-    def _update_system_overview(self, cycle_stats):
+    def _update_system_overview(self, snapshot, cycle_stats):
 
         total_nodes = len(self.network_manager.nodes)
         active_nodes = cycle_stats['active_nodes']
         occupied_slots = cycle_stats['vehicle_detections']
         
-        self.current_data['system_overview'] = {
+        snapshot['system_overview'] = {
             'total_slots': total_nodes,
             'available_slots': active_nodes - occupied_slots,
             'occupied_slots': occupied_slots,
@@ -136,14 +233,22 @@ class IoTDataServer:
                                      cycle_stats['failed_transmissions'])) * 100, 1)
         }
     
-    def _update_parking_slots(self):
+    def _update_parking_slots(self, snapshot, statuses):
 
-        slots_data = {}
+        # Copy-on-write: unchanged slot dicts are shared with the previous snapshot
+        slots_data = dict(snapshot['parking_slots'])
+        now = datetime.now()
         
-        for i, node in enumerate(self.network_manager.nodes, 1):
-            slot_id = f"slot-{i}"
-            battery_status = node.power.get_battery_status()
+        for i, (slot_id, (node, battery_status)) in enumerate(zip(self._slot_ids, statuses), 1):
+            
+            # Only rebuild slots whose visible state changed since last cycle
+            state = (node.vehicle_present, node.is_online,
+                     int(battery_status['charge_percentage'] * 10))
+            if self._last_node_state.get(node.node_id) == state:
+                continue
             
+            self._last_node_state[node.node_id] = state
+            self._dirty_slots.add(node.node_id)
             slots_data[slot_id] = {
                 'id': i,
                 'node_id': node.node_id,
@@ -152,76 +257,152 @@ class IoTDataServer:
                 'online': node.is_online,
                 'battery_level': battery_status['charge_percentage'],
                 'confidence': 0.95 if node.is_online else 0.0,
-                'last_update': datetime.now().isoformat()
+                'last_update': now
             }
         
-        self.current_data['parking_slots'] = slots_data
+        snapshot['parking_slots'] = slots_data
     
-    def _update_environmental_data(self):
+    def _update_environmental_data(self, snapshot):
 
         if self.network_manager.nodes:
             # Get environmental data from first active node
             for node in self.network_manager.nodes:
                 if node.is_online:
                     env_data = node.environmental.read_environment()
-                    self.current_data['environmental'] = env_data
+                    snapshot['environmental'] = env_data
                     break
     
-    def _update_battery_status(self):
+    def _update_battery_status(self, snapshot, statuses):
 
-        battery_data = {}
+        battery_data = dict(snapshot['battery_status'])
         
-        for node in self.network_manager.nodes:
-            battery_status = node.power.get_battery_status()
+        for node, battery_status in statuses:
+            
+            # Compare every published field, not just the slot state key
+            state = (battery_status['charge_percentage'], battery_status['status'],
+                     battery_status['solar_panel'], battery_status['estimated_runtime_hours'])
+            if self._last_battery_state.get(node.node_id) == state:
+                continue
+            
+            self._last_battery_state[node.node_id] = state
+            self._dirty_batteries.add(node.node_id)
             battery_data[node.node_id] = {
-                'charge_percentage': battery_status['charge_percentage'],
-                'status': battery_status['status'],
-                'solar_panel': battery_status['solar_panel'],
-                'estimated_runtime': battery_status['estimated_runtime_hours']
+                'charge_percentage': state[0],
+                'status': state[1],
+                'solar_panel': state[2],
+                'estimated_runtime': state[3]
             }
         
-        self.current_data['battery_status'] = battery_data
+        snapshot['battery_status'] = battery_data
     
-    def _update_blockchain_stats(self):
+    def _update_blockchain_stats(self, snapshot):
 
         if self.network_manager.blockchain:
             stats = self.network_manager.blockchain.get_stats()
-            self.current_data['blockchain_stats'] = stats
+            snapshot['blockchain_stats'] = stats
     
-    def _add_recent_activity(self, cycle_stats):
+    def _add_recent_activity(self, snapshot, cycle_stats):
 
         current_time = datetime.now()
+        recent_activity = snapshot['recent_activity']
         
+        # Copy the bounded log only when this cycle adds to it
+        if cycle_stats['traffic_events'] > 0 or cycle_stats['low_battery_nodes'] > 0:
+            recent_activity = deque(recent_activity, maxlen=20)
+            snapshot['recent_activity'] = recent_activity
 
         if cycle_stats['traffic_events'] > 0:
             activity = {
-                'timestamp': current_time.isoformat(),
+                'timestamp': current_time,
                 'type': 'traffic',
                 'message': f"{cycle_stats['traffic_events']} vehicle movement(s) detected",
                 'details': f"Blockchain updates: {cycle_stats['blockchain_updates']}"
             }
-            self.current_data['recent_activity'].insert(0, activity)
+            recent_activity.appendleft(activity)
         
 
         if cycle_stats['low_battery_nodes'] > 0:
             activity = {
-                'timestamp': current_time.isoformat(),
+                'timestamp': current_time,
                 'type': 'warning',
                 'message': f"{cycle_stats['low_battery_nodes']} sensor(s) have low battery",
                 'details': "Consider maintenance"
             }
-            self.current_data['recent_activity'].insert(0, activity)
-        
+            recent_activity.appendleft(activity)
 
-        self.current_data['recent_activity'] = self.current_data['recent_activity'][:20]
+    def _publish_cache(self):
+
+        # Boot id keeps ETags from a previous server run from matching
+        etag = f"{self._boot_id}-{self.cycle_seq}"
+        previous = self.cached_inner
+        inner = {}
+        
+        # orjson does not serialize deques, so flatten the activity log once here
+        data = dict(self.current_data)
+        data['recent_activity'] = list(data['recent_activity'])
+        
+        dirty = {'parking_slots': self._dirty_slots, 'battery_status': self._dirty_batteries}
+        for key, value in data.items():
+            # Reuse last cycle's bytes for per-node sections that did not change
+            if key in DELTA_SECTIONS and key in previous and not dirty[key]:
+                inner[key] = previous[key]
+            else:
+                inner[key] = orjson.dumps(value, option=ORJSON_OPTIONS)
+        
+        self._dirty_slots.clear()
+        self._dirty_batteries.clear()
+        self.cached_inner = inner
+        
+        # Wrap the section bytes directly instead of re-serializing envelopes
+        payloads = {key: _SUCCESS_PREFIX + body + b'}' for key, body in inner.items()}
+        payloads['all_data'] = (
+            _SUCCESS_PREFIX + b'{'
+            + b','.join(orjson.dumps(key) + b':' + body for key, body in inner.items())
+            + b'},"timestamp":' + orjson.dumps(datetime.now(), option=ORJSON_OPTIONS) + b'}'
+        )
+        
+        # Compress once per cycle rather than once per request
+        compressed = {
+            key: gzip.compress(body, COMPRESS_LEVEL, mtime=0)
+            for key, body in payloads.items()
+            if len(body) >= COMPRESS_MIN_SIZE
+        }
+        
+        # Single reference swap so request handlers never see a partial cache
+        self.cached = (etag, payloads, compressed)
+        
+        # Wake SSE streams waiting for the next cycle
+        with self._cycle_cond:
+            self._cycle_cond.notify_all()
+    
+    def wait_for_cycle(self, etag, timeout):
+        """Block until a cache newer than etag is published or timeout expires"""
+        with self._cycle_cond:
+            self._cycle_cond.wait_for(lambda: self.cached[0] != etag, timeout)
+        return self.cached
 
 # Global data server instance
 data_server = IoTDataServer()
 
-@app.route('/')
-def dashboard():
+def cached_response(key):
+    """Serve the JSON bytes serialized by the collector thread"""
+    etag, payloads, compressed = data_server.cached
+    data_server.request_refresh()
+    
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif key in compressed and request.accept_encodings['gzip']:
+        response = Response(compressed[key], mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(payloads[key], mimetype='application/json')
+    
+    response.set_etag(etag, weak=True)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'max-age=5'
+    return response
 
-    return render_template_string("""
+_DASHBOARD_HTML = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -242,75 +423,76 @@ def dashboard():
         </ul>
     </body>
     </html>
-    """)
+    """
+
+@app.route('/')
+def dashboard():
+
+    return Response(_DASHBOARD_HTML, mimetype='text/html')
 
 @app.route('/api/system-overview')
 def get_system_overview():
     """Get system overview data"""
-    return jsonify({
-        'status': 'success',
-        'data': data_server.current_data['system_overview']
-    })
+    return cached_response('system_overview')
 
 @app.route('/api/parking-slots')
 def get_parking_slots():
     """Get parking slots data"""
-    return jsonify({
-        'status': 'success',
-        'data': data_server.current_data['parking_slots']
-    })
+    return cached_response('parking_slots')
 
 @app.route('/api/environmental')
 def get_environmental():
     """Get environmental sensor data"""
-    return jsonify({
-        'status': 'success',
-        'data': data_server.current_data['environmental']
-    })
+    return cached_response('environmental')
 
 @app.route('/api/battery-status')
 def get_battery_status():
     """Get battery status for all sensors"""
-    return jsonify({
-        'status': 'success',
-        'data': data_server.current_data['battery_status']
-    })
+    return cached_response('battery_status')
 
 @app.route('/api/recent-activity')
 def get_recent_activity():
     """Get recent activity log"""
-    return jsonify({
-        'status': 'success',
-        'data': data_server.current_data['recent_activity']
-    })
+    return cached_response('recent_activity')
 
 @app.route('/api/blockchain-stats')
 def get_blockchain_stats():
     """Get blockchain statistics"""
-    return jsonify({
-        'status': 'success',
-        'data': data_server.current_data['blockchain_stats']
-    })
+    return cached_response('blockchain_stats')
 
 @app.route('/api/all-data')
 def get_all_data():
 
-    return jsonify({
-        'status': 'success',
-        'data': data_server.current_data,
-        'timestamp': datetime.now().isoformat()
-    })
+    return cached_response('all_data')
+
+@app.route('/api/stream')
+def stream_all_data():
+    """Push all data to the client once per collector cycle (Server-Sent Events)"""
+    def generate():
+        last_etag = None
+        while True:
+            etag, payloads, _ = data_server.wait_for_cycle(last_etag, STREAM_KEEPALIVE)
+            if etag == last_etag:
+                # Comment line keeps proxies from closing an idle stream
+                yield b': keepalive\n\n'
+                continue
+            
+            last_etag = etag
+            yield b'id: ' + etag.encode() + b'\ndata: ' + payloads['all_data'] + b'\n\n'
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/status')
 def get_status():
 
-    return jsonify({
+    return ojsonify({
         'status': 'success',
         'server_running': True,
         'data_collection_active': data_server.is_running,
         'network_initialized': data_server.network_manager is not None,
         'total_nodes': len(data_server.network_manager.nodes) if data_server.network_manager else 0,
-        'timestamp': datetime.now().isoformat()
+        'timestamp': datetime.now()
     })
 
 def initialize_and_start():
@@ -327,6 +509,7 @@ def initialize_and_start():
             print(" Flask API server ready to serve real IoT data")
             print("Dashboard can now access real-time data at:")
             print("   - http://localhost:5000/api/all-data")
+            print("   - http://localhost:5000/api/stream")
             print("   - http://localhost:5000/api/system-overview")
             print("   - http://localhost:5000/api/parking-slots")
             return True
@@ -337,6 +520,14 @@ def initialize_and_start():
         print("Failed to initialize IoT network")
         return False
 
+def create_app():
+    """Application factory for WSGI servers such as gunicorn"""
+    if os.environ.get('IOT_AUTOSTART', '1') == '1' and not data_server.is_running:
+        if not initialize_and_start():
+            raise RuntimeError("Failed to initialize IoT data server")
+    
+    return app
+
 if __name__ == '__main__':
     try:
         # Initialize everything
@@ -359,7 +550,7 @@ if __name__ == '__main__':
             
     except KeyboardInterrupt:
         print("\nServer stopped by user")
-        data_server.is_running = False
+        data_server.stop_data_collection()
     except Exception as e:
         print(f" Server error: {str(e)}")
-        data_server.is_running = False
+        data_server.stop_data_collection()
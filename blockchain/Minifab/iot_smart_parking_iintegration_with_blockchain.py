@@ -3,37 +3,63 @@ import json
 import time
 import random
 import threading
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
 import sys
+from collections import deque
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from itertools import islice
+from typing import Deque, Dict, List, NamedTuple, Tuple
 import queue
 import logging
+from logging.handlers import RotatingFileHandler
+import asyncio
+import numpy as np
+import orjson
+
+try:
+    from hfc.fabric import Client as FabricClient
+except ImportError:
+    FabricClient = None
 
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler('iot_parking.log'),
+        RotatingFileHandler('iot_parking.log', maxBytes=10_000_000, backupCount=3, encoding='utf-8'),
         logging.StreamHandler(sys.stdout)
     ]
 )
 logger = logging.getLogger(__name__)
 
-@dataclass
-class IoTSensor:
-    sensor_id: str
-    slot_id: str
-    location: str
-    battery_level: float
-    last_reading: datetime
-    status: str  # 'active', 'low_battery', 'offline'
-    occupied: bool
-    confidence: float  # Sensor reading confidence (0-1)
+# Fabric SDK settings (see spec.yaml / network.sh); minifab CLI is used when unavailable
+FABRIC_PROFILE = os.environ.get('FABRIC_PROFILE', 'vars/profiles/autochannel_connection_for_pythonsdk.json')
+FABRIC_CHANNEL = os.environ.get('FABRIC_CHANNEL', 'autochannel')
+FABRIC_ORG = os.environ.get('FABRIC_ORG', 'manufacturer.auto.com')
+# Endorsing peers, comma separated; by default the first peer of every org in the profile
+FABRIC_PEERS = [peer for peer in os.environ.get('FABRIC_PEERS', '').split(',') if peer]
+
+MINIFAB_CACHE_FILE = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+    'iot_parking', 'minifab_cmd.json'
+)
+
+EVENT_HISTORY_SIZE = 10_000  # Recent events kept for the dashboard
+CYCLE_SECONDS = 6.0  # 6 seconds per cycle = 10 cycles per minute
+DASHBOARD_INTERVAL = 1.0  # Seconds between dashboard refreshes
+CLEAR_SEQ = "\x1b[2J\x1b[H"  # ANSI clear screen + cursor home
+
+# Display labels for event types, so logging does not re-title strings per event
+EVENT_LABELS = {t: t.title() for t in ('initialization', 'arrival', 'departure', 'heartbeat')}
 
-@dataclass
+BATCH_MAX = 64  # Max events per chaincode invocation
+BATCH_TIMEOUT_MS = 250  # Max wait to fill a batch, mirrors the orderer batch timeout
+MAX_INFLIGHT = 16  # Max concurrent chaincode submissions through the Fabric SDK
+MAX_RETRIES = 5  # Attempts per batch before it is dead-lettered
+INVOKE_TIMEOUT = 30  # Seconds allowed for one chaincode invocation, SDK or CLI
+
+@dataclass(slots=True)
 class ParkingEvent:
     sensor_id: str
     slot_id: str
@@ -43,14 +69,136 @@ class ParkingEvent:
     confidence: float
     event_type: str  # 'arrival', 'departure', 'heartbeat'
 
+class Snapshot(NamedTuple):
+    """Immutable view of the simulator state, rebuilt once per cycle for the dashboard"""
+    timestamp: datetime
+    total_sensors: int
+    active_sensors: int
+    occupied_slots: int
+    recent_events: Tuple[ParkingEvent, ...]
+    sensors: 'SensorArrays'
+    status: np.ndarray  # Status codes; each cycle assigns a new array, never mutates it
+
+# Status codes stored in SensorArrays.status
+SENSOR_STATUSES = ('active', 'low_battery', 'offline')
+STATUS_ACTIVE, STATUS_LOW_BATTERY, STATUS_OFFLINE = range(len(SENSOR_STATUSES))
+
+class SensorArrays:
+    """Structure-of-arrays sensor state: one NumPy array per field, indexed by sensor"""
+
+    def __init__(self, sensor_ids: List[str], slot_ids: List[str], locations: List[str],
+                 rng: np.random.Generator):
+        num_sensors = len(sensor_ids)
+        
+        self.sensor_ids = sensor_ids
+        self.slot_ids = slot_ids
+        self.locations = locations
+        
+        # Locations in first-seen order, plus a per-sensor index for bincount aggregation
+        self.location_names = list(dict.fromkeys(locations))
+        location_index = {name: i for i, name in enumerate(self.location_names)}
+        self.location_idx = np.array([location_index[loc] for loc in locations], dtype=np.intp)
+        
+        self.battery = rng.uniform(80, 100, num_sensors).astype(np.float32)
+        self.occupied = rng.random(num_sensors) < 0.5
+        self.confidence = rng.uniform(0.85, 0.99, num_sensors).astype(np.float32)
+        self.status = np.full(num_sensors, STATUS_ACTIVE, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.sensor_ids)
+
+class RingBuffer:
+    """Bounded single-producer/single-consumer queue without a mutex.
+
+    The producer only advances _tail and the consumer only advances _head;
+    under the GIL each of those stores is atomic, so neither side locks.
+    """
+
+    def __init__(self, capacity_pow2: int = 16):
+        self._size = 1 << capacity_pow2
+        self._mask = self._size - 1
+        self._buffer = [None] * self._size
+        self._head = 0
+        self._tail = 0
+        self.not_empty = threading.Event()
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def try_put(self, item) -> bool:
+        tail = self._tail
+        if tail - self._head >= self._size:
+            return False
+        
+        self._buffer[tail & self._mask] = item
+        self._tail = tail + 1  # Publish only after the slot is written
+        
+        if not self.not_empty.is_set():
+            self.not_empty.set()
+        return True
+
+    def try_get(self):
+        head = self._head
+        if head == self._tail:
+            return None
+        
+        index = head & self._mask
+        item = self._buffer[index]
+        self._buffer[index] = None
+        self._head = head + 1
+        return item
+
+    def get(self, timeout: float):
+        """Return the next item, waiting up to timeout seconds; None if still empty"""
+        item = self.try_get()
+        if item is None:
+            self.not_empty.clear()
+            # Re-check after clearing so a put racing with clear() is not missed
+            item = self.try_get()
+            if item is None and self.not_empty.wait(timeout):
+                item = self.try_get()
+        return item
+
 class IoTBlockchainConnector:
     def __init__(self, minifab_path="./"):
         self.minifab_path = minifab_path
         self.chaincode_name = "parking"
-        self.minifab_cmd = self.detect_minifab_command()
-        self.transaction_queue = queue.Queue()
+        self.minifab_cmd = self.load_minifab_command()
+        self.fabric = self.connect_sdk()
+        self._slot_tail: Dict[str, asyncio.Future] = {}
+        self._record_prefix: Dict[str, bytes] = {}
+        self.transaction_queue = RingBuffer()
         self.is_running = False
+        self._shutdown = threading.Event()
+        self.dlq = queue.Queue()  # Events that exhausted their retries, for operator inspection
+        
+    def load_minifab_command(self):
+
+        path = os.environ.get('PATH', '')
+        cwd = os.getcwd()
         
+        # Reuse the last probe result while PATH and working directory are unchanged
+        try:
+            with open(MINIFAB_CACHE_FILE) as f:
+                cached = json.load(f)
+            cmd = cached['cmd']
+            if (cached['path'] == path and cached['cwd'] == cwd
+                    and all(os.path.exists(part) for part in cmd if part.startswith('./'))):
+                return cmd
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        
+        cmd = self.detect_minifab_command()
+        if cmd:
+            try:
+                os.makedirs(os.path.dirname(MINIFAB_CACHE_FILE), exist_ok=True)
+                with open(MINIFAB_CACHE_FILE, 'w') as f:
+                    json.dump({'path': path, 'cwd': cwd, 'cmd': cmd}, f)
+            except OSError as e:
+                logger.warning(" Could not cache minifab command: %s", e)
+        
+        return cmd
+    
     def detect_minifab_command(self):
 
         possible_commands = [
@@ -74,66 +222,260 @@ class IoTBlockchainConnector:
         
         return None
     
-    def update_blockchain(self, slot_id: str, occupied: bool, location: str) -> bool:
+    def connect_sdk(self):
 
+        if FabricClient is None:
+            return None
+        
+        profile = os.path.join(self.minifab_path, FABRIC_PROFILE)
+        if not os.path.exists(profile):
+            return None
+        
         try:
-            occupied_str = "true" if occupied else "false"
-            param_str = f'"UpdateStatus","{slot_id}","{occupied_str}","{location}"'
+            # One long-lived client: no process launch or TLS handshake per transaction
+            client = FabricClient(net_profile=profile)
+            client.new_channel(FABRIC_CHANNEL)
+            requestor = client.get_user(org_name=FABRIC_ORG, name='Admin')
             
-            cmd = self.minifab_cmd + [
-                "invoke", 
-                "-n", self.chaincode_name,
-                "-p", param_str
-            ]
+            # One peer per org so the default MAJORITY endorsement policy is met
+            with open(profile, 'rb') as f:
+                organizations = orjson.loads(f.read()).get('organizations', {})
+            peers = FABRIC_PEERS or [org['peers'][0] for org in organizations.values()
+                                     if org.get('peers')]
+            if not peers:
+                raise ValueError(f"no peers defined in {profile}")
             
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            logger.info(" Connected to Fabric via SDK: %s on %s", ', '.join(peers), FABRIC_CHANNEL)
+            return client, requestor, peers
+        except Exception as e:
+            logger.warning(" Fabric SDK unavailable, falling back to minifab CLI: %s", e)
+            return None
+    
+    async def invoke_chaincode(self, fcn: str, args: List[str]) -> bool:
+
+        if self.fabric:
+            client, requestor, peers = self.fabric
+            # Bound the call so a hung endorsement cannot hold an in-flight slot forever
+            response = await asyncio.wait_for(client.chaincode_invoke(
+                requestor=requestor,
+                channel_name=FABRIC_CHANNEL,
+                peers=peers,
+                args=args,
+                cc_name=self.chaincode_name,
+                fcn=fcn,
+                wait_for_event=True
+            ), timeout=INVOKE_TIMEOUT)
             
-            if result.returncode == 0:
-                logger.info(f"Blockchain updated: {slot_id} -> {occupied}")
-                return True
-            else:
-                logger.error(f"Blockchain update failed: {result.stderr}")
+            # hfc returns rejected endorsements as a message instead of raising; the
+            # functions invoked here return no payload, so any text back is an error
+            if response:
+                logger.error("Blockchain update failed: %s", response)
                 return False
+            return True
+        
+        param_str = ",".join(json.dumps(arg) for arg in [fcn] + args)
+        
+        cmd = self.minifab_cmd + [
+            "invoke", 
+            "-n", self.chaincode_name,
+            "-p", param_str
+        ]
+        
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=INVOKE_TIMEOUT)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+        
+        if process.returncode != 0:
+            logger.error("Blockchain update failed: %s", stderr.decode(errors='replace'))
+            return False
+        return True
+    
+    def register_slot(self, slot_id: str, location: str) -> bytes:
+        """Pre-encode the static part of a slot's batch record"""
+        prefix = orjson.dumps({'id': slot_id, 'location': location})[:-1] + b',"occupied":'
+        self._record_prefix[slot_id] = prefix
+        return prefix
+    
+    async def update_blockchain_batch(self, events: List[ParkingEvent]) -> bool:
+
+        try:
+            # Group writes by location and slot; the stable sort keeps per-slot order
+            records = []
+            for event in sorted(events, key=lambda e: (e.location, e.slot_id)):
+                prefix = (self._record_prefix.get(event.slot_id)
+                          or self.register_slot(event.slot_id, event.location))
+                records.append(prefix + (b'true}' if event.occupied else b'false}'))
+            payload = b'[' + b','.join(records) + b']'
+            
+            if await self.invoke_chaincode("UpdateStatusBatch", [payload.decode()]):
+                logger.info("Blockchain batch updated: %d slot(s)", len(events))
+                return True
+            return False
                 
         except Exception as e:
-            logger.error(f"Blockchain update error: {str(e)}")
+            logger.error("Blockchain batch update error: %s", e)
             return False
     
-    def process_transaction_queue(self):
+    def submit_event(self, event: ParkingEvent) -> bool:
 
-        while self.is_running:
-            try:
-                event = self.transaction_queue.get(timeout=1)
-                success = self.update_blockchain(
-                    event.slot_id, 
-                    event.occupied, 
-                    event.location
-                )
-                
-                if not success:
-                    # Retry failed transactions
-                    logger.warning(f" Retrying failed transaction for {event.slot_id}")
-                    time.sleep(2)
-                    self.update_blockchain(event.slot_id, event.occupied, event.location)
-                
-                self.transaction_queue.task_done()
-                
-            except queue.Empty:
+        while not self.transaction_queue.try_put(event):
+            if not self.is_running:
+                logger.warning(" Transaction queue full, dropping event for %s", event.slot_id)
+                return False
+            time.sleep(0.01)  # Back off until the processor drains the buffer
+        return True
+    
+    def collect_batch(self) -> List[ParkingEvent]:
+
+        # Sleep until an event is published or stop() nudges the buffer
+        buffer = self.transaction_queue
+        event = buffer.try_get()
+        while event is None:
+            buffer.not_empty.clear()
+            # Re-check after clearing so neither a put nor stop() racing with clear() is missed
+            event = buffer.try_get()
+            if event is None:
+                if self._shutdown.is_set():
+                    return []
+                buffer.not_empty.wait()
+                event = buffer.try_get()
+        
+        batch = [event]
+        
+        # Keep filling until the batch is full or the batch window closes
+        deadline = time.monotonic() + BATCH_TIMEOUT_MS / 1000
+        while len(batch) < BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            event = self.transaction_queue.get(timeout=remaining)
+            if event is None:
+                break
+            batch.append(event)
+        
+        return batch
+    
+    async def submit_batch(self, batch: List[ParkingEvent], predecessors: List[asyncio.Future],
+                           done: asyncio.Future):
+
+        try:
+            # Wait for earlier batches touching the same slots to keep per-slot order
+            if predecessors:
+                await asyncio.gather(*predecessors)
+            
+            async with self._inflight:
+                for attempt in range(MAX_RETRIES):
+                    if await self.update_blockchain_batch(batch):
+                        break
+                    
+                    if attempt + 1 < MAX_RETRIES:
+                        # Exponential backoff with jitter: 0.1, 0.2, 0.4, 0.8 s ...
+                        delay = min(0.1 * 2 ** attempt, 1.0) + random.random() * 0.05
+                        logger.warning(" Retrying failed batch of %d transaction(s) in %.2fs",
+                                       len(batch), delay)
+                        await asyncio.sleep(delay)
+                else:
+                    logger.error(" Batch of %d transaction(s) failed after %d attempts, "
+                                 "moved to dead-letter queue", len(batch), MAX_RETRIES)
+                    for event in batch:
+                        self.dlq.put(event)
+        finally:
+            done.set_result(None)
+            for event in batch:
+                if self._slot_tail.get(event.slot_id) is done:
+                    del self._slot_tail[event.slot_id]
+    
+    def dispatch_batch(self, batch: List[ParkingEvent]) -> asyncio.Task:
+
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        
+        predecessors = []
+        for event in batch:
+            previous = self._slot_tail.get(event.slot_id)
+            if previous is not None and previous is not done and previous not in predecessors:
+                predecessors.append(previous)
+            self._slot_tail[event.slot_id] = done
+        
+        return asyncio.create_task(self.submit_batch(batch, predecessors, done))
+    
+    async def process_transaction_queue_async(self):
+
+        loop = asyncio.get_running_loop()
+        # minifab drives one container and rewrites its vars/ files per call, so the
+        # CLI fallback must run invocations one at a time
+        self._inflight = asyncio.Semaphore(MAX_INFLIGHT if self.fabric else 1)
+        pending = set()
+        
+        while not self._shutdown.is_set():
+            # Block for the next batch off the event loop so submissions keep running
+            batch = await loop.run_in_executor(None, self.collect_batch)
+            if not batch:
                 continue
+            
+            task = self.dispatch_batch(self.coalesce_batch(batch))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        
+        # Let in-flight submissions finish before the loop closes
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
         
         logger.info(" Transaction processor stopped")
+    
+    def coalesce_batch(self, batch: List[ParkingEvent]) -> List[ParkingEvent]:
+
+        # Only the newest state per slot matters on-chain; walk backwards so the
+        # latest event wins and keeps its position relative to heartbeats
+        seen = set()
+        coalesced = []
+        for event in reversed(batch):
+            if event.event_type == 'heartbeat':
+                coalesced.append(event)  # Liveness signals are never dropped
+            elif event.slot_id not in seen:
+                seen.add(event.slot_id)
+                coalesced.append(event)
+        
+        coalesced.reverse()
+        if len(coalesced) < len(batch):
+            logger.debug(" Coalesced %d superseded event(s)", len(batch) - len(coalesced))
+        return coalesced
+    
+    def start(self):
+
+        self._shutdown.clear()
+        self.is_running = True
+    
+    def stop(self):
+
+        self.is_running = False
+        self._shutdown.set()
+        self.transaction_queue.not_empty.set()  # Wake the processor if it is idle
+    
+    def process_transaction_queue(self):
+
+        asyncio.run(self.process_transaction_queue_async())
 
 class IoTSensorSimulator:
     def __init__(self, blockchain_connector: IoTBlockchainConnector):
-        self.sensors: Dict[str, IoTSensor] = {}
+        self.rng = np.random.default_rng()
+        self.sensors = SensorArrays([], [], [], self.rng)
         self.blockchain = blockchain_connector
-        self.event_history: List[ParkingEvent] = []
+        self.event_history: Deque[ParkingEvent] = deque(maxlen=EVENT_HISTORY_SIZE)
+        self.total_event_count = 0
+        self.arrival_count = 0
+        self.departure_count = 0
         self.simulation_active = False
+        self._stop_evt = threading.Event()
         
 
         self.car_arrival_rate = 0.1  # Probability per minute
@@ -141,9 +483,43 @@ class IoTSensorSimulator:
         self.sensor_error_rate = 0.02  # Probability of false reading
         self.battery_drain_rate = 0.001  # Battery % per hour
         
+        self.reset_aggregates()
+        
+    def reset_aggregates(self):
+        """Recompute running counters from scratch; cycles then keep them current by delta"""
+        sensors = self.sensors
+        num_locations = len(sensors.location_names)
+        active = sensors.status == STATUS_ACTIVE
+        
+        self.occupied_count = int(np.count_nonzero(sensors.occupied))
+        self.status_counts = np.bincount(sensors.status, minlength=len(SENSOR_STATUSES))
+        self.confidence_sum = float(sensors.confidence.sum(dtype=np.float64))
+        self.battery_sum = float(sensors.battery.sum(dtype=np.float64))
+        
+        self.location_totals = np.bincount(sensors.location_idx, minlength=num_locations)
+        self.location_occupied = np.bincount(sensors.location_idx[sensors.occupied],
+                                             minlength=num_locations)
+        self.location_active = np.bincount(sensors.location_idx[active], minlength=num_locations)
+        self.publish_snapshot(datetime.now())
+        
+    def publish_snapshot(self, now: datetime):
+        """Build a new Snapshot and swap it in; readers never see a partial update"""
+        sensors = self.sensors
+        
+        # Counters only; the dashboard derives alert lists on its own thread
+        self.snapshot = Snapshot(
+            timestamp=now,
+            total_sensors=len(sensors),
+            active_sensors=int(self.status_counts[STATUS_ACTIVE]),
+            occupied_slots=self.occupied_count,
+            recent_events=tuple(islice(reversed(self.event_history), 5))[::-1],
+            sensors=sensors,
+            status=sensors.status
+        )
+        
     def create_sensors(self, num_sensors: int):
         """Create IoT sensors for parking slots"""
-        logger.info(f" Creating {num_sensors} IoT sensors...")
+        logger.info(" Creating %d IoT sensors...", num_sensors)
         
         locations = [
             "Mall Entrance", "Mall Exit", "Ground Floor A", "Ground Floor B",
@@ -151,144 +527,153 @@ class IoTSensorSimulator:
             "VIP Section", "Disabled Parking", "Electric Vehicle", "Visitor Parking"
         ]
         
-        for i in range(num_sensors):
-            sensor_id = f"IOT-{i+1:03d}"
-            slot_id = f"lot-{i+1:03d}"
-            location = locations[i % len(locations)]
-            
-            sensor = IoTSensor(
-                sensor_id=sensor_id,
-                slot_id=slot_id,
-                location=location,
-                battery_level=random.uniform(80, 100),
-                last_reading=datetime.now(),
-                status='active',
-                occupied=random.choice([True, False]),
-                confidence=random.uniform(0.85, 0.99)
-            )
-            
-            self.sensors[sensor_id] = sensor
-            
-
-            self.blockchain.transaction_queue.put(
-                ParkingEvent(
-                    sensor_id=sensor_id,
-                    slot_id=slot_id,
-                    location=location,
-                    occupied=sensor.occupied,
-                    timestamp=datetime.now(),
-                    confidence=sensor.confidence,
-                    event_type='initialization'
-                )
-            )
+        sensor_ids = [f"IOT-{i+1:03d}" for i in range(num_sensors)]
+        slot_ids = [f"lot-{i+1:03d}" for i in range(num_sensors)]
+        sensor_locations = [locations[i % len(locations)] for i in range(num_sensors)]
         
-        logger.info(f" Created {len(self.sensors)} IoT sensors")
-    
-    def simulate_car_movement(self, sensor: IoTSensor) -> Optional[ParkingEvent]:
-
+        self.sensors = SensorArrays(sensor_ids, slot_ids, sensor_locations, self.rng)
+        self.reset_aggregates()
         current_time = datetime.now()
         
-
-        if sensor.status != 'active':
-            return None
-        
-
-        if sensor.occupied:
-
-            if random.random() < self.car_departure_rate:
-                sensor.occupied = False
-                sensor.last_reading = current_time
-                
-
-                confidence = max(0.7, sensor.confidence - random.uniform(0, 0.1))
-                
-                return ParkingEvent(
-                    sensor_id=sensor.sensor_id,
-                    slot_id=sensor.slot_id,
-                    location=sensor.location,
-                    occupied=False,
-                    timestamp=current_time,
-                    confidence=confidence,
-                    event_type='departure'
-                )
-        else:
-
-            if random.random() < self.car_arrival_rate:
-                sensor.occupied = True
-                sensor.last_reading = current_time
-                
-
-                confidence = max(0.7, sensor.confidence - random.uniform(0, 0.1))
-                
-                return ParkingEvent(
-                    sensor_id=sensor.sensor_id,
-                    slot_id=sensor.slot_id,
-                    location=sensor.location,
-                    occupied=True,
+        for i, (occupied, confidence) in enumerate(zip(self.sensors.occupied.tolist(),
+                                                       self.sensors.confidence.tolist())):
+            self.blockchain.register_slot(slot_ids[i], sensor_locations[i])
+            self.blockchain.submit_event(
+                ParkingEvent(
+                    sensor_id=sensor_ids[i],
+                    slot_id=slot_ids[i],
+                    location=sensor_locations[i],
+                    occupied=occupied,
                     timestamp=current_time,
                     confidence=confidence,
-                    event_type='arrival'
+                    event_type='initialization'
                 )
+            )
         
-        return None
+        logger.info(" Created %d IoT sensors", len(self.sensors))
     
-    def simulate_sensor_issues(self, sensor: IoTSensor):
-
-
-        sensor.battery_level -= self.battery_drain_rate
-        
-
-        if sensor.battery_level < 20:
-            sensor.status = 'low_battery'
-        elif sensor.battery_level < 5:
-            sensor.status = 'offline'
-        else:
-            sensor.status = 'active'
+    def simulate_car_movement(self, now: datetime, movement_draws: np.ndarray,
+                              confidence_draws: np.ndarray) -> List[ParkingEvent]:
+
+        sensors = self.sensors
+        
+        # One draw per sensor decides an arrival (if free) or a departure (if occupied)
+        active = sensors.status == STATUS_ACTIVE
+        departures = active & sensors.occupied & (movement_draws < self.car_departure_rate)
+        arrivals = active & ~sensors.occupied & (movement_draws < self.car_arrival_rate)
+        
+        moved = np.flatnonzero(arrivals | departures)
+        if moved.size == 0:
+            return []
+        
+        sensors.occupied[moved] = ~sensors.occupied[moved]
+        
+        arrived = moved[sensors.occupied[moved]]
+        departed = moved[~sensors.occupied[moved]]
+        num_locations = len(sensors.location_names)
+        self.occupied_count += arrived.size - departed.size
+        self.location_occupied += (np.bincount(sensors.location_idx[arrived], minlength=num_locations)
+                                   - np.bincount(sensors.location_idx[departed], minlength=num_locations))
+        
+
+        confidences = np.maximum(0.7, sensors.confidence[moved] - confidence_draws[moved] * 0.1)
+        
+        events = []
+        for i, occupied, confidence in zip(moved.tolist(), sensors.occupied[moved].tolist(),
+                                           confidences.tolist()):
+            events.append(ParkingEvent(
+                sensor_id=sensors.sensor_ids[i],
+                slot_id=sensors.slot_ids[i],
+                location=sensors.locations[i],
+                occupied=occupied,
+                timestamp=now,
+                confidence=confidence,
+                event_type='arrival' if occupied else 'departure'
+            ))
+        
+        return events
+    
+    def simulate_sensor_issues(self, error_draws: np.ndarray):
+
+        sensors = self.sensors
+        sensors.battery -= self.battery_drain_rate
+        self.battery_sum -= self.battery_drain_rate * len(sensors)
+        
+
+        status = np.select(
+            [sensors.battery < 20, sensors.battery < 5],
+            [STATUS_LOW_BATTERY, STATUS_OFFLINE],
+            STATUS_ACTIVE
+        ).astype(np.uint8)
+        
+        changed = np.flatnonzero(status != sensors.status)
+        if changed.size:
+            old, new = sensors.status[changed], status[changed]
+            num_statuses = len(SENSOR_STATUSES)
+            num_locations = len(sensors.location_names)
+            self.status_counts += (np.bincount(new, minlength=num_statuses)
+                                   - np.bincount(old, minlength=num_statuses))
+            self.location_active += (
+                np.bincount(sensors.location_idx[changed[new == STATUS_ACTIVE]], minlength=num_locations)
+                - np.bincount(sensors.location_idx[changed[old == STATUS_ACTIVE]], minlength=num_locations)
+            )
+        sensors.status = status
         
 
-        if random.random() < self.sensor_error_rate:
-            sensor.confidence = max(0.5, sensor.confidence - 0.2)
+        errors = np.flatnonzero(error_draws < self.sensor_error_rate)
+        if errors.size:
+            before = float(sensors.confidence[errors].sum(dtype=np.float64))
+            sensors.confidence[errors] = np.maximum(0.5, sensors.confidence[errors] - 0.2)
+            self.confidence_sum += float(sensors.confidence[errors].sum(dtype=np.float64)) - before
     
-    def generate_sensor_heartbeat(self, sensor: IoTSensor) -> ParkingEvent:
+    def generate_sensor_heartbeat(self, index: int, now: datetime) -> ParkingEvent:
 
+        sensors = self.sensors
         return ParkingEvent(
-            sensor_id=sensor.sensor_id,
-            slot_id=sensor.slot_id,
-            location=sensor.location,
-            occupied=sensor.occupied,
-            timestamp=datetime.now(),
-            confidence=sensor.confidence,
+            sensor_id=sensors.sensor_ids[index],
+            slot_id=sensors.slot_ids[index],
+            location=sensors.locations[index],
+            occupied=bool(sensors.occupied[index]),
+            timestamp=now,
+            confidence=float(sensors.confidence[index]),
             event_type='heartbeat'
         )
     
     def run_simulation_cycle(self):
 
         events_generated = 0
+        cycle_now = datetime.now()  # One wall-clock timestamp shared by the whole cycle
         
-        for sensor in self.sensors.values():
-
-            self.simulate_sensor_issues(sensor)
+        # All random numbers for the cycle in one generator call, one row per use
+        movement_draws, error_draws, confidence_draws = self.rng.random((3, len(self.sensors)))
+        
+        self.simulate_sensor_issues(error_draws)
+        
+        for event in self.simulate_car_movement(cycle_now, movement_draws, confidence_draws):
+            self.event_history.append(event)
+            self.total_event_count += 1
+            if event.event_type == 'arrival':
+                self.arrival_count += 1
+            else:
+                self.departure_count += 1
             
 
-            event = self.simulate_car_movement(sensor)
-            if event:
-                self.event_history.append(event)
+            if event.confidence > 0.75:
+                self.blockchain.submit_event(event)
+                events_generated += 1
                 
-
-                if event.confidence > 0.75:
-                    self.blockchain.transaction_queue.put(event)
-                    events_generated += 1
-                    
-                    logger.info(f" {event.event_type.title()}: {event.slot_id} at {event.location}")
+                logger.info(" %s: %s at %s", EVENT_LABELS[event.event_type], event.slot_id, event.location)
         
+        self.publish_snapshot(cycle_now)
         return events_generated
     
     def start_simulation(self, duration_minutes: int = 30):
 
-        logger.info(f" Starting IoT simulation for {duration_minutes} minutes...")
+        logger.info(" Starting IoT simulation for %d minutes...", duration_minutes)
         
         self.simulation_active = True
-        self.blockchain.is_running = True
+        self._stop_evt.clear()
+        self.blockchain.start()
         
 
         blockchain_thread = threading.Thread(
@@ -297,77 +682,88 @@ class IoTSensorSimulator:
         )
         blockchain_thread.start()
         
-        start_time = datetime.now()
-        end_time = start_time + timedelta(minutes=duration_minutes)
+        # Monotonic clock for scheduling; wall-clock time only goes into events
+        start_time = time.monotonic()
+        end_time = start_time + duration_minutes * 60
         
         cycle_count = 0
         total_events = 0
         
         try:
-            while datetime.now() < end_time and self.simulation_active:
+            while time.monotonic() < end_time and self.simulation_active:
                 cycle_count += 1
                 events = self.run_simulation_cycle()
                 total_events += events
                 
                 if cycle_count % 10 == 0:  # Status every 10 cycles
-                    active_sensors = sum(1 for s in self.sensors.values() if s.status == 'active')
-                    occupied_slots = sum(1 for s in self.sensors.values() if s.occupied)
+                    active_sensors = int(self.status_counts[STATUS_ACTIVE])
+                    occupied_slots = self.occupied_count
                     
-                    logger.info(f" Cycle {cycle_count}: {active_sensors} active sensors, "
-                              f"{occupied_slots} occupied slots, {events} new events")
+                    logger.info(" Cycle %d: %d active sensors, %d occupied slots, %d new events",
+                                cycle_count, active_sensors, occupied_slots, events)
                 
-                time.sleep(6)  # 6 seconds per cycle = 10 cycles per minute
+                # Sleep to the next fixed deadline so cycle runtime does not accumulate as drift
+                delay = start_time + cycle_count * CYCLE_SECONDS - time.monotonic()
+                if delay > 0 and self._stop_evt.wait(delay):
+                    break
                 
         except KeyboardInterrupt:
             logger.info(" Simulation stopped by user")
+        finally:
+            # Always release the processor, which otherwise waits for events indefinitely
+            self.simulation_active = False
+            self.blockchain.stop()
         
-        self.simulation_active = False
-        self.blockchain.is_running = False
-        
-        logger.info(f" Simulation completed: {total_events} events generated in {cycle_count} cycles")
+        logger.info(" Simulation completed: %d events generated in %d cycles", total_events, cycle_count)
         
         return self.generate_simulation_report()
     
+    def stop_simulation(self):
+
+        self.simulation_active = False
+        self._stop_evt.set()  # Interrupt the wait between cycles
+    
     def generate_simulation_report(self) -> Dict:
 
         current_time = datetime.now()
         
 
-        active_sensors = [s for s in self.sensors.values() if s.status == 'active']
-        low_battery_sensors = [s for s in self.sensors.values() if s.status == 'low_battery']
-        offline_sensors = [s for s in self.sensors.values() if s.status == 'offline']
+        total_sensors = len(self.sensors)
+        active_sensors = int(self.status_counts[STATUS_ACTIVE])
+        low_battery_sensors = int(self.status_counts[STATUS_LOW_BATTERY])
+        offline_sensors = int(self.status_counts[STATUS_OFFLINE])
         
 
-        occupied_slots = [s for s in self.sensors.values() if s.occupied]
-        free_slots = [s for s in self.sensors.values() if not s.occupied]
+        occupied_slots = self.occupied_count
+        free_slots = total_sensors - occupied_slots
         
 
-        arrivals = [e for e in self.event_history if e.event_type == 'arrival']
-        departures = [e for e in self.event_history if e.event_type == 'departure']
+        avg_confidence = self.confidence_sum / total_sensors
+        avg_battery = self.battery_sum / total_sensors
         
-
-        avg_confidence = sum(s.confidence for s in self.sensors.values()) / len(self.sensors)
-        avg_battery = sum(s.battery_level for s in self.sensors.values()) / len(self.sensors)
+        dead_letter_events = self.blockchain.dlq.qsize()
+        logger.info(" Dead-letter queue: %d event(s)", dead_letter_events)
         
         report = {
             'simulation_summary': {
-                'total_sensors': len(self.sensors),
-                'active_sensors': len(active_sensors),
-                'low_battery_sensors': len(low_battery_sensors),
-                'offline_sensors': len(offline_sensors),
-                'sensor_health': f"{(len(active_sensors)/len(self.sensors))*100:.1f}%"
+                'total_sensors': total_sensors,
+                'active_sensors': active_sensors,
+                'low_battery_sensors': low_battery_sensors,
+                'offline_sensors': offline_sensors,
+                'sensor_health': f"{(active_sensors/total_sensors)*100:.1f}%"
             },
             'parking_status': {
-                'occupied_slots': len(occupied_slots),
-                'free_slots': len(free_slots),
-                'occupancy_rate': f"{(len(occupied_slots)/len(self.sensors))*100:.1f}%"
+                'occupied_slots': occupied_slots,
+                'free_slots': free_slots,
+                'occupancy_rate': f"{(occupied_slots/total_sensors)*100:.1f}%"
             },
             'event_statistics': {
-                'total_events': len(self.event_history),
-                'car_arrivals': len(arrivals),
-                'car_departures': len(departures),
+                'total_events': self.total_event_count,
+                'car_arrivals': self.arrival_count,
+                'car_departures': self.departure_count,
                 'avg_sensor_confidence': f"{avg_confidence:.2f}",
-                'avg_battery_level': f"{avg_battery:.1f}%"
+                'avg_battery_level': f"{avg_battery:.1f}%",
+                'dead_letter_events': dead_letter_events
             },
             'location_breakdown': self.get_location_breakdown(),
             'timestamp': current_time.isoformat()
@@ -379,20 +775,14 @@ class IoTSensorSimulator:
 
         location_stats = {}
         
-        for sensor in self.sensors.values():
-            location = sensor.location
-            if location not in location_stats:
-                location_stats[location] = {
-                    'total_slots': 0,
-                    'occupied_slots': 0,
-                    'active_sensors': 0
-                }
-            
-            location_stats[location]['total_slots'] += 1
-            if sensor.occupied:
-                location_stats[location]['occupied_slots'] += 1
-            if sensor.status == 'active':
-                location_stats[location]['active_sensors'] += 1
+        for location, total, occupied_count, active_count in zip(
+                self.sensors.location_names, self.location_totals.tolist(),
+                self.location_occupied.tolist(), self.location_active.tolist()):
+            location_stats[location] = {
+                'total_slots': total,
+                'occupied_slots': occupied_count,
+                'active_sensors': active_count
+            }
         
         # Calculate occupancy rates
         for location, stats in location_stats.items():
@@ -404,47 +794,75 @@ class IoTSensorSimulator:
         return location_stats
 
 class IoTDashboard:
-    def __init__(self, simulator: IoTSensorSimulator):
+    def __init__(self, simulator: IoTSensorSimulator, interval: float = DASHBOARD_INTERVAL):
         self.simulator = simulator
+        self.interval = interval
+        self._stop_evt = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Refresh the terminal on a background thread, off the simulation loop"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_evt.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+
+        self._stop_evt.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+    
+    def _run(self):
+
+        while True:
+            self.print_real_time_status()
+            if self._stop_evt.wait(self.interval):
+                break
     
     def print_real_time_status(self):
 
-        os.system('clear' if os.name == 'posix' else 'cls')
+        snap = self.simulator.snapshot  # Single reference read; the simulator swaps, never mutates
+        
+        sys.stdout.write(CLEAR_SEQ)
+        sys.stdout.flush()
         
         print(" IoT SMART PARKING SYSTEM - REAL-TIME STATUS")
         print("=" * 80)
-        print(f" Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f" Time: {snap.timestamp.strftime('%Y-%m-%d %H:%M:%S')}")
         
 
-        total_sensors = len(self.simulator.sensors)
-        active_sensors = sum(1 for s in self.simulator.sensors.values() if s.status == 'active')
-        occupied_slots = sum(1 for s in self.simulator.sensors.values() if s.occupied)
+        total_sensors = snap.total_sensors
+        occupied_slots = snap.occupied_slots
+        occupancy_rate = (occupied_slots/total_sensors)*100 if total_sensors else 0.0
         
         print(f"\n SYSTEM OVERVIEW:")
         print(f"     Total Sensors: {total_sensors}")
-        print(f"     Active Sensors: {active_sensors}")
+        print(f"     Active Sensors: {snap.active_sensors}")
         print(f"     Occupied Slots: {occupied_slots}")
         print(f"     Free Slots: {total_sensors - occupied_slots}")
-        print(f"    Occupancy Rate: {(occupied_slots/total_sensors)*100:.1f}%")
+        print(f"    Occupancy Rate: {occupancy_rate:.1f}%")
         
 
-        recent_events = self.simulator.event_history[-5:] if self.simulator.event_history else []
         print(f"\n RECENT EVENTS:")
-        for event in recent_events:
+        for event in snap.recent_events:
             icon = "" if event.occupied else "P"
             print(f"    {icon} {event.timestamp.strftime('%H:%M:%S')} - "
                   f"{event.slot_id} ({event.location}) - {event.event_type}")
         
 
-        low_battery = [s for s in self.simulator.sensors.values() if s.status == 'low_battery']
-        offline = [s for s in self.simulator.sensors.values() if s.status == 'offline']
+        sensors = snap.sensors
+        low_battery = np.flatnonzero(snap.status == STATUS_LOW_BATTERY).tolist()
+        offline = np.flatnonzero(snap.status == STATUS_OFFLINE).tolist()
         
         if low_battery or offline:
             print(f"\n SENSOR ALERTS:")
-            for sensor in low_battery:
-                print(f"     {sensor.sensor_id}: Low Battery ({sensor.battery_level:.1f}%)")
-            for sensor in offline:
-                print(f"    {sensor.sensor_id}: Offline")
+            for i in low_battery:
+                print(f"     {sensors.sensor_ids[i]}: Low Battery ({sensors.battery[i]:.1f}%)")
+            for i in offline:
+                print(f"    {sensors.sensor_ids[i]}: Offline")
 
 def main():
 
@@ -454,12 +872,15 @@ def main():
     # Initialize blockchain connector
     blockchain = IoTBlockchainConnector()
     
-    if not blockchain.minifab_cmd:
+    if not blockchain.fabric and not blockchain.minifab_cmd:
         print(" Could not detect minifab command!")
         print(" Please ensure you have ./minifab or minifab in PATH")
         return
     
-    print(f" Blockchain connector initialized: {' '.join(blockchain.minifab_cmd)}")
+    if blockchain.fabric:
+        print(f" Blockchain connector initialized: Fabric SDK ({', '.join(blockchain.fabric[2])})")
+    else:
+        print(f" Blockchain connector initialized: {' '.join(blockchain.minifab_cmd)}")
     
     # Initialize IoT simulator
     simulator = IoTSensorSimulator(blockchain)
@@ -492,8 +913,10 @@ def main():
 
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         report_file = f'iot_simulation_report_{timestamp}.json'
-        with open(report_file, 'w') as f:
-            json.dump(report, f, indent=2, default=str)
+        # Serialize up front so the file is written in a single call
+        data = orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+        with open(report_file, 'wb') as f:
+            f.write(data)
         
         print(f"\n Detailed report saved: {report_file}")
         print(" IoT simulation completed successfully!")
@@ -501,7 +924,7 @@ def main():
     except KeyboardInterrupt:
         print("\n Simulation interrupted by user")
     except Exception as e:
-        logger.error(f" Error during simulation: {str(e)}")
+        logger.error(" Error during simulation: %s", e)
         print(f" Simulation error: {str(e)}")
 
 if __name__ == "__main__":